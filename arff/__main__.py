@@ -0,0 +1,332 @@
+'''
+Command line tool for arff files, run it with `python -m arff`.
+
+    python -m arff info data/part-*.arff
+    python -m arff head -n 5 sonar.arff
+    python -m arff tail -n 5 sonar.arff
+    python -m arff select -c attribute_1,Class sonar.arff
+    python -m arff sample -n 100 --seed 1 sonar.arff
+    python -m arff split -n 8 -o 'part-%02d.arff.gz' sonar.arff
+    python -m arff convert sonar.arff sonar.csv
+
+All the commands stream, so they run in constant memory whatever the size of
+the file. Output goes to stdout unless given a file with -o.
+'''
+
+import os
+import sys
+import csv
+import errno
+import random
+import argparse
+from collections import deque
+
+import arff
+
+_BLOCK_SIZE = 1 << 16
+
+
+def _stdout():
+    # bytes go to the underlying buffer on python 3
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+
+def _is_data_line(line):
+    return line.strip() and not line.startswith(arff.COMMENT.encode('ascii'))
+
+def _raw_header(fhand):
+    # The header lines as they are in the file, up to and including @data
+    for line in fhand:
+        yield line
+        if line.lower().startswith(arff.DATA.encode('ascii')):
+            return
+
+def _open_reader(fname):
+    fhand = arff._open(fname, 'rb')
+    reader = arff.Reader(fhand)
+    reader.read_header()
+    return fhand, reader
+
+def _write_rows(rows, relation, fields, output):
+    names = [f.name for f in fields]
+    types = [arff._writer_type(f) for f in fields]
+    if output:
+        arff.dump(output, rows, relation, names, types)
+    else:
+        out = _stdout()
+        for line in arff.dump_lines(rows, relation, names, types):
+            out.write((line + os.linesep).encode('utf-8'))
+
+
+def info(args):
+    dataset = arff.Dataset(args.files, processes=args.workers)
+    print('relation: %s' % dataset.relation)
+    print('files: %d' % len(dataset.paths))
+    print('rows: %d' % dataset.row_count)
+    print('attributes: %d' % len(dataset.fields))
+    for field in dataset.fields:
+        for line in arff._attribute_lines(field.name, arff._writer_type(field)):
+            print('    %s' % line)
+
+def head(args):
+    out = _stdout()
+    with arff._open(args.file, 'rb') as fhand:
+        for line in _raw_header(fhand):
+            out.write(line)
+        count = 0
+        for line in fhand:
+            if count >= args.lines:
+                break
+            if _is_data_line(line):
+                out.write(line)
+                count += 1
+
+def _tail_lines(fname, count, data_start):
+    # Read blocks backwards from the end until `count` data lines are found
+    with open(fname, 'rb') as fhand:
+        fhand.seek(0, os.SEEK_END)
+        position = fhand.tell()
+        block = b''
+        data_lines = []
+        while position > data_start:
+            step = min(_BLOCK_SIZE, position - data_start)
+            position -= step
+            fhand.seek(position)
+            block = fhand.read(step) + block
+            lines = block.splitlines(True)
+            if position > data_start:
+                # the first line may have started in the previous block
+                lines = lines[1:]
+            data_lines = [line for line in lines if _is_data_line(line)]
+            if len(data_lines) >= count:
+                break
+        return data_lines[-count:] if count else []
+
+def tail(args):
+    out = _stdout()
+    compressed = os.path.splitext(args.file)[1].lower() in arff._COMPRESSORS
+    with arff._open(args.file, 'rb') as fhand:
+        for line in _raw_header(fhand):
+            out.write(line)
+        if compressed:
+            # no seeking in compressed streams, keep the last lines seen
+            lines = deque((line for line in fhand if _is_data_line(line)),
+                          maxlen=args.lines)
+        else:
+            lines = _tail_lines(args.file, args.lines, fhand.tell())
+    for line in lines:
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        out.write(line)
+
+def _unquote(name):
+    return name.strip('\'"')
+
+def _column_indices(fields, columns):
+    names = [_unquote(f.name) for f in fields]
+    indices = []
+    for column in columns.split(','):
+        if _unquote(column) in names:
+            indices.append(names.index(_unquote(column)))
+        elif column.lstrip('-').isdigit():
+            index = int(column)
+            if not -len(names) <= index < len(names):
+                raise SystemExit("No attribute %s, there are %d" %
+                                 (column, len(names)))
+            indices.append(index % len(names))
+        else:
+            raise SystemExit("No attribute %r" % column)
+    return indices
+
+def select(args):
+    fhand, reader = _open_reader(args.file)
+    with fhand:
+        indices = _column_indices(reader.fields, args.columns)
+        fields = [reader.fields[i] for i in indices]
+        rows = ([list(row)[i] for i in indices] for row in reader)
+        _write_rows(rows, reader.relation, fields, args.output)
+
+def _reservoir(rows, size, rng):
+    # Algorithm R, a uniform sample of `size` rows in one pass
+    sample = []
+    for i, row in enumerate(rows):
+        if i < size:
+            sample.append(row)
+        else:
+            j = rng.randint(0, i)
+            if j < size:
+                sample[j] = row
+    return sample
+
+def sample(args):
+    rng = random.Random(args.seed)
+    fhand, reader = _open_reader(args.file)
+    with fhand:
+        rows = (list(row) for row in reader)
+        if args.fraction is not None:
+            rows = (row for row in rows if rng.random() < args.fraction)
+        else:
+            rows = _reservoir(rows, args.lines, rng)
+        _write_rows(rows, reader.relation, reader.fields, args.output)
+
+def split(args):
+    fhand, reader = _open_reader(args.file)
+    with fhand:
+        writer = arff.ShardedWriter(args.output, shards=args.shards,
+            relation=reader.relation,
+            names=[f.name for f in reader.fields],
+            types=[arff._writer_type(f) for f in reader.fields],
+            key=args.key, max_bytes=args.max_bytes, threads=args.threads)
+        for row in reader:
+            writer.write(list(row))
+        writer.close()
+    for fname in writer.fnames:
+        print(fname)
+
+def _csv_value(text):
+    if text in ('', arff.MISSING):
+        return None
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+def _csv_types(row):
+    types = []
+    for value in row:
+        if isinstance(value, (int, float)):
+            types.append('real')
+        else:
+            types.append('string')
+    return types
+
+def _csv_rows(lines, first_row):
+    # Parse the columns as typed by the first data row, integers may turn
+    # out to be floats further down.
+    parsers = []
+    for value in first_row:
+        parsers.append({int: float, type(None): str}.get(type(value), type(value)))
+    yield first_row
+    for row in lines:
+        if row:
+            yield [None if text in ('', arff.MISSING) else parse(text)
+                   for parse, text in zip(parsers, row)]
+
+def _is_csv(fname):
+    return os.path.splitext(fname)[1].lower() == '.csv'
+
+def _dump_header(fname, relation, names, types):
+    # dump() writes the header along with the first row, there is none
+    writer = arff.Writer(fname, relation, names, types)
+    for line in writer.header_lines(None):
+        writer.fhand.write((line + os.linesep).encode('utf-8'))
+    writer.close()
+
+def convert(args):
+    if _is_csv(args.input):
+        relation = args.relation or os.path.basename(args.input)
+        with open(args.input) as fhand:
+            lines = csv.reader(fhand)
+            names = next(lines, None)
+            if not names:
+                raise SystemExit("%s has no header line" % args.input)
+            row = next(lines, None)
+            if row is None:
+                # nothing to infer the types from, keep every value
+                _dump_header(args.output, relation, names,
+                             ['string'] * len(names))
+                return
+            first_row = [_csv_value(text) for text in row]
+            types = _csv_types(first_row)
+            arff.dump(args.output, _csv_rows(lines, first_row), relation,
+                      names, types)
+        return
+
+    fhand, reader = _open_reader(args.input)
+    with fhand:
+        if _is_csv(args.output):
+            with open(args.output, 'w') as out:
+                writer = csv.writer(out, lineterminator='\n')
+                writer.writerow([_unquote(f.name) for f in reader.fields])
+                for row in reader:
+                    writer.writerow(['' if value is None else value
+                                     for value in row])
+        else:
+            rows = (list(row) for row in reader)
+            arff.dump(args.output, rows, args.relation or reader.relation,
+                      [f.name for f in reader.fields],
+                      [arff._writer_type(f) for f in reader.fields])
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m arff',
+                                     description='Stream large arff files.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('info', help='header and row count')
+    command.add_argument('files', nargs='+')
+    command.add_argument('-w', '--workers', type=int, default=None,
+                         help='processes counting rows (default: all cores)')
+    command.set_defaults(func=info)
+
+    for name, func in [('head', head), ('tail', tail)]:
+        command = commands.add_parser(name, help='the header and the %s rows'
+                                      % ('first' if name == 'head' else 'last'))
+        command.add_argument('file')
+        command.add_argument('-n', '--lines', type=int, default=10)
+        command.set_defaults(func=func)
+
+    command = commands.add_parser('select', help='keep some attributes')
+    command.add_argument('file')
+    command.add_argument('-c', '--columns', required=True,
+                         help='comma separated attribute names or indices')
+    command.add_argument('-o', '--output')
+    command.set_defaults(func=select)
+
+    command = commands.add_parser('sample', help='random rows')
+    command.add_argument('file')
+    group = command.add_mutually_exclusive_group()
+    group.add_argument('-n', '--lines', type=int, default=10,
+                       help='rows to keep, in memory')
+    group.add_argument('-f', '--fraction', type=float,
+                       help='keep each row with this probability, streaming')
+    command.add_argument('--seed', type=int)
+    command.add_argument('-o', '--output')
+    command.set_defaults(func=sample)
+
+    command = commands.add_parser('split', help='split into shards')
+    command.add_argument('file')
+    command.add_argument('-o', '--output', required=True,
+                         help="shard file pattern, e.g. 'part-%%02d.arff.gz'")
+    command.add_argument('-n', '--shards', type=int, default=None,
+                         help='number of shards (default: one per core)')
+    command.add_argument('-k', '--key', help='attribute to route rows by')
+    command.add_argument('--max-bytes', type=int,
+                         help='fill shards one after another up to this size')
+    command.add_argument('--threads', action='store_true',
+                         help='write the shards on threads, not processes')
+    command.set_defaults(func=split)
+
+    command = commands.add_parser('convert', help='to and from csv, '
+                                  'compressed by .gz or .bz2 extensions')
+    command.add_argument('input')
+    command.add_argument('output')
+    command.add_argument('-r', '--relation')
+    command.set_defaults(func=convert)
+
+    return parser
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    try:
+        args.func(args)
+    except IOError as e:
+        # e.g. piped into head
+        if e.errno != errno.EPIPE:
+            raise
+        sys.stderr.close()
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,13 @@ unittests for arff.py
 '''
 
 import unittest
+import io
 import os
+import mmap
+import shutil
+import subprocess
+import sys
+import tempfile
 
 import arff
 
@@ -99,7 +105,656 @@ blue, 18.2, 3
         fname = os.path.join(SRC_DIR, 'glass.arff')
         data = list(arff.load(fname))
 
-        
+
+    def test_columns(self):
+        fname = os.path.join(SRC_DIR, 'glass.arff')
+        with open(fname) as fhand:
+            columns = arff.Reader(fhand).columns()
+        rows = list(arff.load(fname))
+        self.assertEqual(len(columns), len(rows[0]))
+        self.assertEqual(list(columns.values())[-1], [list(row)[-1] for row in rows])
+
+    def test_bytes(self):
+        text = u('''@relation r
+@attribute name string
+@attribute c {a, b}
+@attribute x real
+@attribute n integer
+@data
+'caf\u00e9',a,1.5,3
+% comment
+'x',b,?,-4
+''')
+        expected = [[list(row) for row in arff.loads(text)]]
+        data = text.encode('utf-8')
+        for buf in [data, bytearray(data), memoryview(data)]:
+            rows = [list(row) for row in arff.loads(buf)]
+            self.assertEqual([rows], expected)
+        rows = list(arff.Reader(io.BytesIO(data.replace(b'\n', b'\r\n'))))
+        self.assertEqual([[list(row) for row in rows]], expected)
+        self.assertEqual(rows[0].name, u('caf\u00e9'))
+
+        fname = os.path.join(SRC_DIR, 'glass.arff')
+        with open(fname) as fhand:
+            text_rows = [list(row) for row in arff.Reader(fhand)]
+        with open(fname, 'rb') as fhand:
+            buf = mmap.mmap(fhand.fileno(), 0, access=mmap.ACCESS_READ)
+            mmap_rows = [list(row) for row in arff.loads(buf)]
+            buf.close()
+        self.assertEqual(mmap_rows, text_rows)
+
+    def test_nominal_quotes(self):
+        # nominal values come back without the quotes around them
+        row = next(arff.load(os.path.join(SRC_DIR, 'glass.arff')))
+        self.assertEqual(list(row)[-1], 'build wind float')
+        text = u('''@relation r
+@attribute c {'a b', c}
+@data
+'a b'
+"a b"
+c
+'c'
+''')
+        self.assertEqual([row[0] for row in arff.loads(text)],
+                         ['a b', 'a b', 'c', 'c'])
+
+    def test_matrix(self):
+        for name in ['sonar.arff', 'ionosphere.arff', 'glass.arff']:
+            fname = os.path.join(SRC_DIR, name)
+            rows = [list(row) for row in arff.load(fname)]
+            for chunk_size in [100, 1 << 20]:
+                m = arff.load_matrix(fname, chunk_size=chunk_size)
+                self.assertEqual(m.shape, (len(rows), len(rows[0]) - 1))
+                self.assertEqual(list(m.values),
+                                 [x for row in rows for x in row[:-1]])
+                self.assertEqual([m.classes[code] for code in m.labels],
+                                 [row[-1].strip('\'"') for row in rows])
+                self.assertEqual(list(m.row(1)), rows[1][:-1])
+
+    def test_matrix_missing(self):
+        text = u('''@relation r
+@attribute x real
+@attribute n integer
+@attribute class {a, 'b c'}
+@data
+1.5,2,a
+% comment
+
+?,3,'b c'
+4,5,?
+''')
+        for data in [text, text.encode('utf-8')]:
+            m = arff.Reader(data if isinstance(data, bytes)
+                            else io.StringIO(data)).matrix()
+            self.assertEqual(m.shape, (3, 2))
+            self.assertEqual(m.values[:2].tolist(), [1.5, 2.0])
+            self.assertTrue(m.values[2] != m.values[2])
+            self.assertEqual(list(m.labels), [0, 1, -1])
+
+        self.assertRaises(ValueError, arff.load_matrix,
+                          os.path.join(SRC_DIR, 'example.arff'))
+        bad = text.replace('4,5,?', '4,?')
+        self.assertRaises(ValueError, arff.Reader(io.StringIO(bad)).matrix)
+        # the chunk total matches but the rows don't
+        bad = u('@relation r\n@attribute x real\n@attribute y real\n'
+                '@data\n1,2,3\n4\n')
+        self.assertRaises(ValueError, arff.Reader(io.StringIO(bad)).matrix)
+
+
+class TestTypeRegistry(unittest.TestCase):
+    def test_lazy_registration(self):
+        Point = type('Point', (object,), {'__module__': 'fake_geometry.points'})
+        calls = []
+        def register():
+            calls.append(1)
+            arff.register_type(Point, 'string', lambda p: "'point'")
+        arff.register_lazy('fake_geometry', register)
+        self.assertEqual(calls, [])
+        lines = list(arff.dump_lines([[Point(), 1], [Point(), 2]]))
+        self.assertEqual(lines[1:3], ['@attribute attr0 string',
+                                      '@attribute attr1 integer'])
+        self.assertEqual(lines[-1], "'point',2")
+        self.assertEqual(calls, [1])
+
+    def test_no_optional_imports(self):
+        code = 'import sys, arff; print(sorted(m for m in sys.modules if m in ' \
+               '("numpy", "pandas", "decimal", "multiprocessing")))'
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.join(SRC_DIR, '..', '..'))
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_registration_order(self):
+        # Writers and readers made before a lazy registration runs still see
+        # it. In a fresh interpreter so nothing is registered yet.
+        code = '''if 1:
+            import decimal, io, arff
+            writer = arff._LineWriter()
+            arff.dumps([[decimal.Decimal(1)]])
+            print(writer._arff_type(decimal.Decimal))
+            text = u'@relation r\\n@attribute d date "yyyy-MM-dd"\\n@data\\n'
+            first = arff.Reader(io.StringIO(text))
+            second = arff.Reader(io.StringIO(text))
+            print(len(first.read_header()), len(second.read_header()))
+            '''
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.join(SRC_DIR, '..', '..'))
+        self.assertEqual(output.split(), [b'real', b'1', b'1'])
+
+    def test_dates_and_decimals(self):
+        import datetime
+        import decimal
+        rows = [[datetime.datetime(2012, 3, 4, 5, 6, 7), decimal.Decimal('1.25')]]
+        text = arff.dumps(rows, names=['when', 'price'])
+        self.assertTrue(u('@attribute when date "yyyy-MM-dd\'T\'HH:mm:ss"') in text)
+        self.assertEqual([list(row) for row in arff.loads(text)],
+                         [[rows[0][0], 1.25]])
+
+        text = u('''@relation r
+@attribute day DATE "dd/MM/yyyy"
+@data
+'24/12/2011'
+''')
+        self.assertEqual(list(next(arff.loads(text))),
+                         [datetime.datetime(2011, 12, 24)])
+
+
+MUSK_TEXT = '''@relation musk
+@attribute id {b1, b2, b3}
+@attribute bag relational
+  @attribute f1 numeric
+  @attribute name string
+@end bag
+@attribute class {0, 1}
+@data
+b1,'1,\\'a\\'\\n2.5,\\'b, c\\'',1
+b2,'4,\\'d\\'',0
+b3,?,0
+'''
+
+class TestRelational(unittest.TestCase):
+    def test_rows(self):
+        rows = list(arff.loads(u(MUSK_TEXT)))
+        self.assertEqual(len(rows), 3)
+        bag = rows[0].bag
+        self.assertEqual([list(instance) for instance in bag],
+                         [[1.0, 'a'], [2.5, 'b, c']])
+        self.assertEqual(bag[1].name, 'b, c')
+        self.assertEqual(rows[0]['class'], '1')
+        self.assertEqual(rows[2].bag, None)
+
+    def test_columns(self):
+        columns = arff.Reader(io.StringIO(u(MUSK_TEXT))).columns()
+        bags = columns['bag']
+        self.assertEqual(list(bags.offsets), [0, 2, 3, 3])
+        self.assertEqual(bags.columns['f1'], [1.0, 2.5, 4.0])
+        self.assertEqual(list(bags), [[[1.0, 'a'], [2.5, 'b, c']],
+                                      [[4.0, 'd']], None])
+        self.assertEqual(bags.nulls, set([2]))
+        self.assertEqual(columns['class'], ['1', '0', '0'])
+
+    def test_write(self):
+        rows = list(arff.loads(u(MUSK_TEXT)))[:2]
+        lines = list(arff.dump_lines(rows, names=['id', 'bag', 'class']))
+        self.assertEqual(lines[2:6], ['@attribute bag relational',
+                                      '  @attribute f1 real',
+                                      '  @attribute name string',
+                                      '@end bag'])
+        reparsed = list(arff.loads(u('\n'.join(lines))))
+        self.assertEqual([list(instance) for instance in reparsed[0].bag],
+                         [[1.0, 'a'], [2.5, 'b, c']])
+
+    def test_dataset(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fnames = []
+            for i in range(2):
+                fnames.append(os.path.join(tmp_dir, 'musk%d.arff' % i))
+                with open(fnames[-1], 'w') as fhand:
+                    fhand.write(MUSK_TEXT)
+            self.assertEqual(arff.validate(fnames[0]), [])
+            ds = arff.Dataset(fnames, processes=2)
+            bags = ds.columns()['bag']
+            self.assertEqual(list(bags.offsets), [0, 2, 3, 3, 5, 6, 6])
+            self.assertEqual(bags.nulls, set([2, 5]))
+            rows = list(ds)
+            self.assertEqual(rows[3].bag[1].name, 'b, c')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rows = [['blonde', 17.2, i] for i in range(10)]
+        for shard in range(3):
+            fname = os.path.join(self.tmp_dir, 'part-%d.arff' % shard)
+            arff.dump(fname, self.rows[shard * 4:shard * 4 + 4],
+                      names=['hair_color', 'age', 'patno'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_dataset(self):
+        pattern = os.path.join(self.tmp_dir, 'part-*.arff')
+        for kwargs in [dict(processes=1), dict(processes=2),
+                       dict(processes=2, threads=True)]:
+            ds = arff.Dataset(pattern, **kwargs)
+            self.assertEqual(ds.names, ['hair_color', 'age', 'patno'])
+            self.assertEqual(ds.row_count, 10)
+            self.assertEqual([list(row) for row in ds], self.rows)
+            self.assertEqual(ds.columns()['patno'], list(range(10)))
+
+    def test_bounded_read_ahead(self):
+        started = []
+        def parse(item):
+            started.append(item)
+            return item
+        results = arff._map_in_order(parse, range(20), processes=2,
+                                     threads=True)
+        for i, result in enumerate(results):
+            self.assertEqual(result, i)
+            self.assertTrue(len(started) <= i + 2)
+
+    def test_schema_mismatch(self):
+        arff.dump(os.path.join(self.tmp_dir, 'part-3.arff'), [[1.5, 2]])
+        pattern = os.path.join(self.tmp_dir, 'part-*.arff')
+        self.assertRaises(ValueError, arff.Dataset, pattern)
+        self.assertRaises(ValueError, arff.Dataset, [])
+
+
+class TestShardedWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rows = [['blonde', 17.2, i % 7] for i in range(50)]
+        self.names = ['hair_color', 'age', 'patno']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, pattern, batch_size=8, **kwargs):
+        w = arff.ShardedWriter(os.path.join(self.tmp_dir, pattern),
+                               names=self.names, batch_size=batch_size, **kwargs)
+        for row in self.rows:
+            w.write(row)
+        w.close()
+        return w
+
+    def _sorted(self, rows):
+        return sorted([list(row) for row in rows], key=repr)
+
+    def test_round_robin(self):
+        for threads in [False, True]:
+            w = self._write('rr%d-%%d.arff.gz' % threads, shards=3,
+                            threads=threads)
+            self.assertEqual(len(w.fnames), 3)
+            shard = list(arff.load(w.fnames[1]))
+            self.assertEqual([list(row) for row in shard], self.rows[1::3])
+            ds = arff.Dataset(w.fnames, processes=1)
+            self.assertEqual(self._sorted(ds), self._sorted(self.rows))
+
+    def test_key(self):
+        w = self._write('key-%d.arff', shards=4, key='patno')
+        seen = {}
+        for fname in w.fnames:
+            for row in arff.load(fname):
+                self.assertEqual(seen.setdefault(row.patno, fname), fname)
+        self.assertEqual(len(seen), 7)
+
+    def test_max_bytes(self):
+        for batch_size in [1, 3, 7, 8, 1000]:
+            w = self._write('size%d-%%d.arff' % batch_size, max_bytes=300,
+                            batch_size=batch_size)
+            self.assertTrue(len(w.fnames) > 1)
+            for fname in w.fnames:
+                self.assertTrue(os.path.getsize(fname) <= 300)
+            ds = arff.Dataset(w.fnames, processes=1)
+            self.assertEqual([list(row) for row in ds], self.rows)
+
+    def test_dates(self):
+        import datetime
+        self.rows = [[datetime.datetime(2012, 1, 1 + i % 28), i]
+                     for i in range(50)]
+        self.names = ['day', 'n']
+        types = ['date "dd/MM/yyyy"', 'integer']
+        for i, kwargs in enumerate([{}, {'threads': True}, {'max_bytes': 300}]):
+            w = self._write('dates%d-%%d.arff' % i, shards=3, types=types,
+                            **kwargs)
+            with open(w.fnames[0]) as fhand:
+                self.assertTrue('01/01/2012' in fhand.read())
+            ds = arff.Dataset(w.fnames, processes=1)
+            self.assertEqual(self._sorted(ds), self._sorted(self.rows))
+
+    def test_worker_failure(self):
+        pattern = os.path.join(self.tmp_dir, 'missing', 'p-%d.arff')
+        for threads in [False, True]:
+            w = arff.ShardedWriter(pattern, shards=2, batch_size=1,
+                                   threads=threads)
+            def write_all():
+                for row in self.rows:
+                    w.write(row)
+            self.assertRaises(IOError, write_all)
+            self.assertRaises(IOError, w.close)
+
+
+class TestAppend(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rows = [['blonde', 17.2, 1], ['blue', 27.2, 2]]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_append(self):
+        for ext in ['.arff', '.arff.gz']:
+            fname = os.path.join(self.tmp_dir, 'append' + ext)
+            arff.dump(fname, self.rows[:1], names=['hair_color', 'age', 'patno'])
+            w = arff.Writer(fname, mode='a')
+            w.write(self.rows[1])
+            w.close()
+            rows = list(arff.load(fname))
+            self.assertEqual([list(row) for row in rows], self.rows)
+            self.assertEqual(rows[1].patno, 2)
+
+    def test_append_missing_newline(self):
+        fname = os.path.join(self.tmp_dir, 'append.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n@attribute c {a, b}\n'
+                        '@attribute x real\n@data\na,1.5')
+        w = arff.Writer(fname, mode='a')
+        w.write([arff.Nominal('b'), 2])
+        w.close()
+        self.assertEqual([list(row) for row in arff.load(fname)],
+                         [['a', 1.5], ['b', 2.0]])
+
+    def test_append_checks_rows(self):
+        fname = os.path.join(self.tmp_dir, 'append.arff')
+        arff.dump(fname, self.rows)
+        w = arff.Writer(fname, mode='a')
+        self.assertRaises(ValueError, w.write, [1, 2.5, 3])
+        self.assertRaises(ValueError, w.write, ['blue', 'old', 3])
+        self.assertRaises(ValueError, w.write, ['blue', 2.5])
+        w.write(['blue', 3, 3])
+        w.close()
+        self.assertEqual(len(list(arff.load(fname))), 3)
+        self.assertRaises(ValueError, arff.Writer, fname, mode='r')
+
+    def test_append_dates(self):
+        import datetime
+        fname = os.path.join(self.tmp_dir, 'dates.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n@attribute day date "dd/MM/yyyy"\n'
+                        '@attribute at date "yyyy-MM-dd HH:mm"\n@data\n'
+                        '24/12/2011,\'2011-12-24 18:30\'\n')
+        w = arff.Writer(fname, mode='a')
+        w.write([datetime.date(2012, 1, 31), datetime.datetime(2012, 2, 1, 7, 5)])
+        w.write([None, None])
+        w.close()
+        self.assertEqual([list(row) for row in arff.load(fname)],
+                         [[datetime.datetime(2011, 12, 24),
+                           datetime.datetime(2011, 12, 24, 18, 30)],
+                          [datetime.datetime(2012, 1, 31),
+                           datetime.datetime(2012, 2, 1, 7, 5)],
+                          [None, None]])
+
+    def test_append_new_file(self):
+        fname = os.path.join(self.tmp_dir, 'new.arff')
+        w = arff.Writer(fname, mode='a')
+        for row in self.rows:
+            w.write(row)
+        w.close()
+        self.assertEqual([list(row) for row in arff.load(fname)], self.rows)
+
+
+class TestValidate(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_valid_files(self):
+        for name in ['glass.arff', 'ionosphere.arff', 'sonar.arff']:
+            fname = os.path.join(SRC_DIR, name)
+            self.assertEqual(arff.validate(fname), [])
+            self.assertEqual(arff.validate(fname, processes=3), [])
+
+    def test_errors(self):
+        fname = os.path.join(self.tmp_dir, 'bad.arff')
+        lines = ['@relation r', '@attribute c {a, b}', '@attribute n integer',
+                 '@attribute x real', '@data']
+        expected = []
+        for i in range(300):
+            line_no = len(lines) + 1
+            if i % 50 == 7:
+                lines.append('a,%d,oops' % i)
+                expected.append((line_no, 2, 'x'))
+            elif i % 50 == 30:
+                lines.append('c,1.5,1')
+                expected.extend([(line_no, 0, 'c'), (line_no, 1, 'n')])
+            elif i % 50 == 40:
+                lines.append('a,1')
+                expected.append((line_no, None, None))
+            elif i % 50 == 20:
+                lines.append('A,%d,1E3' % i)
+                expected.append((line_no, 0, 'c'))
+            elif i % 50 == 45:
+                lines.append('b,%d,-Infinity' % i)
+            elif i % 10 == 3:
+                lines.append('% comment')
+            else:
+                lines.append("'b',%d,?" % i)
+        with open(fname, 'w') as fhand:
+            fhand.write('\n'.join(lines) + '\n')
+
+        for processes in [1, 4]:
+            errors = arff.validate(fname, processes=processes)
+            self.assertEqual([e[:3] for e in errors], expected)
+            errors = arff.validate(fname, max_errors=3, processes=processes)
+            self.assertEqual([e[:3] for e in errors], expected[:3])
+
+    def test_dates_and_bags(self):
+        fname = os.path.join(self.tmp_dir, 'dates.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n@attribute d date "yyyy-MM-dd"\n@data\n'
+                        '2012-01-02\n?\nnotadate\n')
+        errors = arff.validate(fname)
+        self.assertEqual([e[:3] for e in errors], [(6, 0, 'd')])
+
+        fname = os.path.join(self.tmp_dir, 'musk.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write(MUSK_TEXT + "b1,'oops,\\'a\\'',1\nb2,'4',0\n")
+        errors = arff.validate(fname)
+        self.assertEqual([e[:3] for e in errors], [(12, 1, 'bag'), (13, 1, 'bag')])
+
+    def test_line_separators(self):
+        # \x0c and \x85 are line breaks to str.splitlines, not to arff
+        fname = os.path.join(self.tmp_dir, 'separators.arff')
+        with io.open(fname, 'w', encoding='utf-8') as fhand:
+            fhand.write(u('@relation r\n@attribute s string\n@attribute n integer\n'
+                          '@data\n') +
+                        u("'a\x0cb',1\n'c\x85d',2\n") * 1000 + u('x,y\n'))
+        for processes in [1, 3]:
+            errors = arff.validate(fname, processes=processes)
+            self.assertEqual([e[:3] for e in errors], [(2005, 1, 'n')])
+
+    def test_indented_header(self):
+        fname = os.path.join(self.tmp_dir, 'indented.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n  @attribute x real\n  @data\n' +
+                        '1.5\n' * 50 + 'oops\n' + '2.5\n' * 50)
+        self.assertEqual(arff._data_offset(fname), (3, 40))
+        for processes in [1, 3]:
+            errors = arff.validate(fname, processes=processes)
+            self.assertEqual([e[:3] for e in errors], [(54, 0, 'x')])
+
+    def test_missing_values(self):
+        text = u('''@relation r
+@attribute c {a, b}
+@attribute x real
+@data
+?,1.5
+a,?
+''')
+        rows = [list(row) for row in arff.loads(text)]
+        self.assertEqual(rows, [[None, 1.5], ['a', None]])
+        self.assertEqual(list(arff.dump_lines(rows, names=['c', 'x'],
+                                              types=['{a, b}', 'real']))[-2:],
+                         ['?,1.5', "'a',?"])
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.sonar = os.path.join(SRC_DIR, 'sonar.arff')
+        self.rows = [list(row) for row in arff.load(self.sonar)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _run(self, *args):
+        return subprocess.check_output([sys.executable, '-m', 'arff'] + list(args),
+                                       cwd=os.path.join(SRC_DIR, '..', '..'))
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_head_tail(self):
+        for command, expected in [('head', self.rows[:3]),
+                                  ('tail', self.rows[-3:])]:
+            output = self._run(command, '-n', '3', self.sonar)
+            rows = [list(row) for row in arff.loads(output)]
+            self.assertEqual(rows, expected)
+
+    def test_tail_blocks(self):
+        main = __import__('arff.__main__', fromlist=['_tail_lines'])
+        offset = arff._data_offset(self.sonar)[1]
+        with open(self.sonar, 'rb') as fhand:
+            lines = fhand.read()[offset:].splitlines(True)
+        try:
+            for block_size in [7, 100, 1 << 16]:
+                main._BLOCK_SIZE = block_size
+                self.assertEqual(main._tail_lines(self.sonar, 5, offset),
+                                 lines[-5:])
+                self.assertEqual(main._tail_lines(self.sonar, 1000, offset),
+                                 lines)
+        finally:
+            main._BLOCK_SIZE = 1 << 16
+
+    def test_no_rows(self):
+        fname = self._path('empty.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n@attribute a real\n@data\n% none\n')
+        output = self._run('tail', '-n', '3', fname)
+        self.assertEqual(list(arff.loads(output.decode('utf-8'))), [])
+
+        with open(self._path('empty.csv'), 'w') as fhand:
+            fhand.write('a,b\n')
+        self._run('convert', self._path('empty.csv'), self._path('c.arff'))
+        with open(self._path('c.arff')) as fhand:
+            reader = arff.Reader(fhand)
+            self.assertEqual([f.name for f in reader.read_header()], ['a', 'b'])
+            self.assertEqual(list(reader), [])
+
+    def test_column_indices(self):
+        main = __import__('arff.__main__', fromlist=['_column_indices'])
+        with open(self.sonar) as fhand:
+            fields = arff.Reader(fhand).read_header()
+        self.assertEqual(main._column_indices(fields, '0,-1,Class'),
+                         [0, 60, 60])
+        for columns in ['61', '-62', 'nope']:
+            self.assertRaises(SystemExit, main._column_indices, fields, columns)
+
+    def test_select_sample(self):
+        self._run('select', '-c', 'attribute_2,Class', '-o', self._path('s.arff'),
+                  self.sonar)
+        rows = [list(row) for row in arff.load(self._path('s.arff'))]
+        self.assertEqual(rows, [[row[1], row[-1]] for row in self.rows])
+
+        self._run('sample', '-n', '5', '--seed', '2', '-o', self._path('s.arff'),
+                  self.sonar)
+        rows = [list(row) for row in arff.load(self._path('s.arff'))]
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(all(row in self.rows for row in rows))
+
+    def test_split_info(self):
+        output = self._run('split', '-n', '3', '-o', self._path('p-%d.arff.gz'),
+                           self.sonar)
+        self.assertEqual(len(output.splitlines()), 3)
+        output = self._run('info', self._path('p-0.arff.gz'),
+                           self._path('p-1.arff.gz'), self._path('p-2.arff.gz'))
+        self.assertTrue(b'rows: 208' in output)
+
+    def test_convert(self):
+        self._run('convert', self.sonar, self._path('s.csv'))
+        self._run('convert', self._path('s.csv'), self._path('s.arff.bz2'))
+        rows = [list(row) for row in arff.load(self._path('s.arff.bz2'))]
+        self.assertEqual(rows, self.rows)
+
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+@unittest.skipIf(pyarrow is None, 'needs pyarrow')
+class TestArrow(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load(self):
+        fname = os.path.join(SRC_DIR, 'glass.arff')
+        rows = [list(row) for row in arff.load(fname)]
+        table = arff.load_arrow(fname, batch_size=50)
+        self.assertEqual(table.num_rows, len(rows))
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema[-1].type))
+        self.assertEqual([list(row.values()) for row in table.to_pylist()], rows)
+        batches = list(arff.iter_arrow_batches(fname, batch_size=50))
+        self.assertEqual([batch.num_rows for batch in batches], [50] * 4 + [14])
+
+    def test_nulls(self):
+        fname = os.path.join(self.tmp_dir, 'nulls.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write('@relation r\n@attribute c {a, b}\n@attribute n integer\n'
+                        '@attribute x real\n@data\n?,1,?\na,?,2.5\n')
+        table = arff.load_arrow(fname)
+        self.assertEqual(table.to_pydict(), {'c': [None, 'a'], 'n': [1, None],
+                                             'x': [None, 2.5]})
+
+    def test_round_trip(self):
+        for name in ['glass.arff', 'sonar.arff']:
+            table = arff.load_arrow(os.path.join(SRC_DIR, name))
+            fname = os.path.join(self.tmp_dir, name)
+            arff.dump_arrow(table, fname, batch_size=30)
+            self.assertTrue(arff.load_arrow(fname).equals(table))
+
+    def test_relational(self):
+        fname = os.path.join(self.tmp_dir, 'musk.arff')
+        with open(fname, 'w') as fhand:
+            fhand.write(MUSK_TEXT)
+        table = arff.load_arrow(fname)
+        bags = table.column('bag')
+        self.assertEqual(bags.to_pylist()[0],
+                         [{'f1': 1.0, 'name': 'a'}, {'f1': 2.5, 'name': 'b, c'}])
+        self.assertEqual(bags.null_count, 1)
+        self.assertEqual(bags.to_pylist()[2], None)
+
+    def test_dump_dictionaries(self):
+        def batch(values):
+            column = pyarrow.array(values).dictionary_encode()
+            return pyarrow.RecordBatch.from_arrays([column], ['c'])
+        fname = os.path.join(self.tmp_dir, 'nominal.arff')
+        table = pyarrow.Table.from_batches([batch(['a', 'b']), batch(['c', 'a'])])
+        arff.dump_arrow(table, fname)
+        self.assertEqual([row[0] for row in arff.load(fname)], ['a', 'b', 'c', 'a'])
+
+        arff.dump_arrow([batch(['a', 'b']), batch(['b', None])], fname)
+        self.assertEqual([row[0] for row in arff.load(fname)], ['a', 'b', 'b', None])
+        self.assertRaises(ValueError, arff.dump_arrow,
+                          [batch(['a', 'b']), batch(['c'])], fname)
+
 
 if __name__ == '__main__':
     unittest.main()